@@ -7,11 +7,14 @@
 module tb ();
 
   // Dump the signals to a VCD file. You can view it with gtkwave or surfer.
+  // Define NO_WAVES (make NO_WAVES=yes) to skip the dump for faster runs.
+`ifndef NO_WAVES
   initial begin
     $dumpfile("tb.vcd");
     $dumpvars(0, tb);
     #1;
   end
+`endif
 
   // Wire up the inputs and outputs:
   reg clk;
@@ -22,6 +25,30 @@ module tb ();
   wire [7:0] uo_out;
   wire [7:0] uio_out;
   wire [7:0] uio_oe;
+
+  // SPI transactions are shifted out by tb_spi_master, the cocotb test only writes
+  // spi_word, raises spi_start and waits for spi_done
+  reg [15:0] spi_word = 16'b0;
+  reg spi_start = 1'b0;
+  wire spi_done;
+  wire spi_SCLK;
+  wire spi_COPI;
+  wire spi_nCS;
+
+  tb_spi_master spi_master (
+      .clk     (clk),
+      .rst_n   (rst_n),
+      .spi_word(spi_word),
+      .start   (spi_start),
+      .done    (spi_done),
+      .SCLK    (spi_SCLK),
+      .COPI    (spi_COPI),
+      .nCS     (spi_nCS)
+  );
+
+  // ui_in[2:0] (nCS, COPI, SCLK) come from the SPI controller
+  wire [7:0] ui_in_dut = {ui_in[7:3], spi_nCS, spi_COPI, spi_SCLK};
+
 `ifdef GL_TEST
   wire VPWR = 1'b1;
   wire VGND = 1'b0;
@@ -36,7 +63,7 @@ module tb ();
       .VGND(VGND),
 `endif
 
-      .ui_in  (ui_in),    // Dedicated inputs
+      .ui_in  (ui_in_dut), // Dedicated inputs
       .uo_out (uo_out),   // Dedicated outputs
       .uio_in (uio_in),   // IOs: Input path
       .uio_out(uio_out),  // IOs: Output path
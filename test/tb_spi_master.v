@@ -0,0 +1,74 @@
+`default_nettype none
+
+/* SPI controller used by the testbench: when start goes high it pulls nCS low and shifts
+   spi_word out on COPI, MSB first, so the cocotb test only waits for done instead of every
+   SCLK edge. SCLK idles low and COPI changes on its falling edge (sampled on the rising edge).
+*/
+module tb_spi_master #(
+    parameter HALF_PERIOD = 50  // clk cycles per SCLK half period (50 x 100 ns = 5 us, 100 kHz SCLK)
+) (
+    input  wire        clk,
+    input  wire        rst_n,
+
+    input  wire [15:0] spi_word,  // {R/W, address[6:0], data[7:0]}
+    input  wire        start,     // Start a transaction, keep high until done
+    output reg         done,      // High once nCS is back high, cleared when start goes low
+
+    // SPI Interface
+    output reg         SCLK,
+    output wire        COPI,
+    output reg         nCS
+);
+    reg [15:0] shift_reg;
+    reg [4:0] bits_left;
+    reg [15:0] half_period_counter;
+
+    assign COPI = shift_reg[15];
+
+    always @(posedge clk or negedge rst_n) begin
+        if (!rst_n) begin
+            shift_reg <= 16'b0;
+            bits_left <= 5'b0;
+            half_period_counter <= 16'b0;
+            SCLK <= 1'b0;
+            nCS <= 1'b1;
+            done <= 1'b0;
+
+        end else if (nCS) begin
+            // Idle: clear done once start is released, start a new transaction otherwise
+            if (!start) begin
+                done <= 1'b0;
+            end else if (!done) begin
+                nCS <= 1'b0;
+                shift_reg <= spi_word;
+                bits_left <= 5'd16;
+                half_period_counter <= 16'b0;
+            end
+
+        end else if (half_period_counter != HALF_PERIOD - 1) begin
+            half_period_counter <= half_period_counter + 1;
+
+        end else begin
+            half_period_counter <= 16'b0;
+
+            // All 16 bits sent and SCLK held low for half a period, end the transaction
+            if (bits_left == 0) begin
+                nCS <= 1'b1;
+                done <= 1'b1;
+            end
+
+            // SCLK rising edge, the peripheral samples COPI
+            else if (!SCLK) begin
+                SCLK <= 1'b1;
+            end
+
+            // SCLK falling edge, move on to the next bit
+            else begin
+                SCLK <= 1'b0;
+                shift_reg <= {shift_reg[14:0], 1'b0};
+                bits_left <= bits_left - 1;
+            end
+        end
+    end
+
+endmodule
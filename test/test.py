@@ -1,32 +1,20 @@
 # SPDX-FileCopyrightText: © 2024 Tiny Tapeout
 # SPDX-License-Identifier: Apache-2.0
 
+# For faster runs, skip the VCD dump and the info-level logging / ANSI colouring:
+#   make -B NO_WAVES=yes COCOTB_LOG_LEVEL=WARNING COCOTB_ANSI_OUTPUT=0
+# With Verilator (SIM=verilator), also enable its optimizer: EXTRA_ARGS="-O3"
+
 import cocotb
 from cocotb.clock import Clock
 from cocotb.triggers import RisingEdge
 from cocotb.triggers import FallingEdge
 from cocotb.triggers import with_timeout
 from cocotb.triggers import Timer
-from cocotb.triggers import First
-from cocotb.triggers import ClockCycles
+from cocotb.result import SimTimeoutError
 from cocotb.types import Logic
-from cocotb.types import LogicArray
-
-async def await_half_sclk(dut):
-    """Wait for the SCLK signal to go high or low."""
-    start_time = cocotb.utils.get_sim_time(units="ns")
-    while True:
-        await ClockCycles(dut.clk, 1)
-        # Wait for half of the SCLK period (10 us)
-        if (start_time + 100*100*0.5) < cocotb.utils.get_sim_time(units="ns"):
-            break
-    return
-
-def ui_in_logicarray(ncs, bit, sclk):
-    """Setup the ui_in value as a LogicArray."""
-    return LogicArray(f"00000{ncs}{bit}{sclk}")
-
-async def send_spi_transaction(dut, r_w, address, data):
+
+async def send_spi_transaction_int(dut, r_w, address, data_int):
     """
     Send an SPI transaction with format:
     - 1 bit for Read/Write
@@ -36,63 +24,21 @@ async def send_spi_transaction(dut, r_w, address, data):
     Parameters:
     - r_w: boolean, True for write, False for read
     - address: int, 7-bit address (0-127)
-    - data: LogicArray or int, 8-bit data
+    - data_int: int, 8-bit data
+
+    Out-of-range address/data are only caught by asserts (skipped under python -O).
     """
-    # Convert data to int if it's a LogicArray
-    if isinstance(data, LogicArray):
-        data_int = int(data)
-    else:
-        data_int = data
-
-    # Validate inputs
-    if address < 0 or address > 127:
-        raise ValueError("Address must be 7-bit (0-127)")
-    if data_int < 0 or data_int > 255:
-        raise ValueError("Data must be 8-bit (0-255)")
-    
-    # Combine RW and address into first byte
-    first_byte = (int(r_w) << 7) | address
-    
-    # Start transaction - pull CS low
-    sclk = 0
-    ncs = 0
-    bit = 0
-    
-    # Set initial state with CS low
-    dut.ui_in.value = ui_in_logicarray(ncs, bit, sclk)
-    await ClockCycles(dut.clk, 1)
-    
-    # Send first byte (RW + Address)
-    for i in range(8):
-        bit = (first_byte >> (7-i)) & 0x1
-        # SCLK low, set COPI
-        sclk = 0
-        dut.ui_in.value = ui_in_logicarray(ncs, bit, sclk)
-        await await_half_sclk(dut)
-        # SCLK high, keep COPI
-        sclk = 1
-        dut.ui_in.value = ui_in_logicarray(ncs, bit, sclk)
-        await await_half_sclk(dut)
-    
-    # Send second byte (Data)
-    for i in range(8):
-        bit = (data_int >> (7-i)) & 0x1
-        # SCLK low, set COPI
-        sclk = 0
-        dut.ui_in.value = ui_in_logicarray(ncs, bit, sclk)
-        await await_half_sclk(dut)
-        # SCLK high, keep COPI
-        sclk = 1
-        dut.ui_in.value = ui_in_logicarray(ncs, bit, sclk)
-        await await_half_sclk(dut)
-    
-    # End transaction - return CS high
-    sclk = 0
-    ncs = 1
-    bit = 0
-    dut.ui_in.value = ui_in_logicarray(ncs, bit, sclk)
-    await ClockCycles(dut.clk, 600)
-    return ui_in_logicarray(ncs, bit, sclk)
+    assert 0 <= address <= 127, "Address must be 7-bit (0-127)"
+    assert 0 <= data_int <= 255, "Data must be 8-bit (0-255)"
+
+    # tb_spi_master.v pulls CS low, shifts out {RW, address, data} MSB-first on SCLK/COPI and
+    # returns CS high, so we only wait for it to finish instead of waking up on every SCLK edge
+    dut.spi_word.value = (int(r_w) << 15) | (address << 8) | data_int
+    dut.spi_start.value = 1
+    # A 16-bit word at 100 kHz takes ~170 us, fail instead of hanging if the controller never finishes
+    await with_timeout(RisingEdge(dut.spi_done), 1, "ms")
+    dut.spi_start.value = 0
+    await Timer(60, units="us")
 
 @cocotb.test()
 async def test_spi(dut):
@@ -105,92 +51,77 @@ async def test_spi(dut):
     # Reset
     dut._log.info("Reset")
     dut.ena.value = 1
-    ncs = 1
-    bit = 0
-    sclk = 0
-    dut.ui_in.value = ui_in_logicarray(ncs, bit, sclk)
+    dut.ui_in.value = 0 # ui_in[2:0] (SPI) is driven by tb_spi_master
     dut.rst_n.value = 0
-    await ClockCycles(dut.clk, 5)
+    await Timer(500, units="ns")
     dut.rst_n.value = 1
-    await ClockCycles(dut.clk, 5)
+    await Timer(500, units="ns")
 
     dut._log.info("Test project behavior")
     dut._log.info("Write transaction, address 0x00, data 0xF0")
-    ui_in_val = await send_spi_transaction(dut, 1, 0x00, 0xF0)  # Write transaction
+    await send_spi_transaction_int(dut, 1, 0x00, 0xF0)  # Write transaction
     assert dut.uo_out.value == 0xF0, f"Expected 0xF0, got {dut.uo_out.value}"
-    await ClockCycles(dut.clk, 1000) 
+    await Timer(100, units="us")
 
     dut._log.info("Write transaction, address 0x01, data 0xCC")
-    ui_in_val = await send_spi_transaction(dut, 1, 0x01, 0xCC)  # Write transaction
+    await send_spi_transaction_int(dut, 1, 0x01, 0xCC)  # Write transaction
     assert dut.uio_out.value == 0xCC, f"Expected 0xCC, got {dut.uio_out.value}"
-    await ClockCycles(dut.clk, 100)
+    await Timer(10, units="us")
 
     dut._log.info("Write transaction, address 0x30 (invalid), data 0xAA")
-    ui_in_val = await send_spi_transaction(dut, 1, 0x30, 0xAA)
-    await ClockCycles(dut.clk, 100)
+    await send_spi_transaction_int(dut, 1, 0x30, 0xAA)
+    await Timer(10, units="us")
 
     dut._log.info("Read transaction (invalid), address 0x00, data 0xBE")
-    ui_in_val = await send_spi_transaction(dut, 0, 0x30, 0xBE)
+    await send_spi_transaction_int(dut, 0, 0x30, 0xBE)
     assert dut.uo_out.value == 0xF0, f"Expected 0xF0, got {dut.uo_out.value}"
-    await ClockCycles(dut.clk, 100)
+    await Timer(10, units="us")
     
     dut._log.info("Read transaction (invalid), address 0x41 (invalid), data 0xEF")
-    ui_in_val = await send_spi_transaction(dut, 0, 0x41, 0xEF)
-    await ClockCycles(dut.clk, 100)
+    await send_spi_transaction_int(dut, 0, 0x41, 0xEF)
+    await Timer(10, units="us")
 
     dut._log.info("Write transaction, address 0x02, data 0xFF")
-    ui_in_val = await send_spi_transaction(dut, 1, 0x02, 0xFF)  # Write transaction
-    await ClockCycles(dut.clk, 100)
+    await send_spi_transaction_int(dut, 1, 0x02, 0xFF)  # Write transaction
+    await Timer(10, units="us")
 
     dut._log.info("Write transaction, address 0x04, data 0xCF")
-    ui_in_val = await send_spi_transaction(dut, 1, 0x04, 0xCF)  # Write transaction
-    await ClockCycles(dut.clk, 30000)
+    await send_spi_transaction_int(dut, 1, 0x04, 0xCF)  # Write transaction
+    await Timer(3, units="ms")
 
     dut._log.info("Write transaction, address 0x04, data 0xFF")
-    ui_in_val = await send_spi_transaction(dut, 1, 0x04, 0xFF)  # Write transaction
-    await ClockCycles(dut.clk, 30000)
+    await send_spi_transaction_int(dut, 1, 0x04, 0xFF)  # Write transaction
+    await Timer(3, units="ms")
 
     dut._log.info("Write transaction, address 0x04, data 0x00")
-    ui_in_val = await send_spi_transaction(dut, 1, 0x04, 0x00)  # Write transaction
-    await ClockCycles(dut.clk, 30000)
+    await send_spi_transaction_int(dut, 1, 0x04, 0x00)  # Write transaction
+    await Timer(3, units="ms")
 
     dut._log.info("Write transaction, address 0x04, data 0x01")
-    ui_in_val = await send_spi_transaction(dut, 1, 0x04, 0x01)  # Write transaction
-    await ClockCycles(dut.clk, 30000)
+    await send_spi_transaction_int(dut, 1, 0x04, 0x01)  # Write transaction
+    await Timer(3, units="ms")
 
     dut._log.info("SPI test completed successfully")
 
-# Detects rising edge and returns the time that has elapsed since then
-async def detect_rising_edge(dut, timeout):
-    previous_signal = dut.uo_out.value.integer & 1
-    starting_time = cocotb.utils.get_sim_time(units="ns")
-
-    while cocotb.utils.get_sim_time(units="ns") - starting_time < timeout:
-        await ClockCycles(dut.clk, 1)
-        current_signal = dut.uo_out.value.integer & 1
-        
-        # If the signal goes low to high, there's a rising edge
-        if previous_signal == 0 and current_signal == 1:
-            return  cocotb.utils.get_sim_time(units="ns")
-        previous_signal = current_signal
-    
-    return False
-
-# Detects falling edge and returns the time that has elapsed since then
-async def detect_falling_edge(dut, timeout):
-    previous_signal = dut.uo_out.value.integer & 1
-    starting_time = cocotb.utils.get_sim_time(units="ns")
-
-    while cocotb.utils.get_sim_time(units="ns") - starting_time < timeout:
-        await ClockCycles(dut.clk, 1)
-        current_signal = dut.uo_out.value.integer & 1
-        
-        # If the signal goes high to low, there's a falling edge
-        if previous_signal == 1 and current_signal == 0:
-            return  cocotb.utils.get_sim_time(units="ns")
-        previous_signal = current_signal
-    
-    return False
+# Detects rising edge on a single-bit signal handle (e.g. dut.uo_out[0]) and returns the time that has elapsed since then
+async def detect_rising_edge(signal, timeout):
+    # Let the simulator wake us up on the edge itself, or enforce the timeout
+    try:
+        await with_timeout(RisingEdge(signal), timeout, "ns")
+    except SimTimeoutError:
+        return False
+
+    return cocotb.utils.get_sim_time(units="ns")
+
+# Detects falling edge on a single-bit signal handle (e.g. dut.uo_out[0]) and returns the time that has elapsed since then
+async def detect_falling_edge(signal, timeout):
+    # Let the simulator wake us up on the edge itself, or enforce the timeout
+    try:
+        await with_timeout(FallingEdge(signal), timeout, "ns")
+    except SimTimeoutError:
+        return False
+
+    return cocotb.utils.get_sim_time(units="ns")
 
 # Measure the time between two rising edges of the PWM signal (period = t_rising_edge2 - t_rising_edge1).
 # Frequency = 1 / period.
@@ -204,26 +135,26 @@ async def test_pwm_freq(dut):
     cocotb.start_soon(clock.start())
 
     # Reset
-    sclk = 0; ncs = 1; bit = 0
-    dut.ui_in.value = ui_in_logicarray(ncs, bit, sclk)
+    dut.ui_in.value = 0 # ui_in[2:0] (SPI) is driven by tb_spi_master
     
     dut.rst_n.value = 0
     dut.ena.value = 1
-    await ClockCycles(dut.clk, 5)
+    await Timer(500, units="ns")
     dut.rst_n.value = 1
-    await ClockCycles(dut.clk, 5)
+    await Timer(500, units="ns")
 
     # Enable PWM output and PWM mode
     dut._log.info("Enabling PWM ouput and mode...")
-    await send_spi_transaction(dut, 1, 0x00, 0x01) # Write 1 to enable output
-    await send_spi_transaction(dut, 1, 0x02, 0x01) # Write 1 to enable PWM mode
-    await send_spi_transaction(dut, 1, 0x04, 0x80) # Write 50% PWM Duty Cycle (128/255 to hex)
-    await ClockCycles(dut.clk, 20000)
+    await send_spi_transaction_int(dut, 1, 0x00, 0x01) # Write 1 to enable output
+    await send_spi_transaction_int(dut, 1, 0x02, 0x01) # Write 1 to enable PWM mode
+    await send_spi_transaction_int(dut, 1, 0x04, 0x80) # Write 50% PWM Duty Cycle (128/255 to hex)
+    await Timer(2, units="ms")
 
     # Measure the time between two rising edges of the PWM signal 
-    start_time = await detect_rising_edge(dut, 1e7)
+    pwm_signal = dut.uo_out[0] # Change the index to whatever pin is enabled above
+    start_time = await detect_rising_edge(pwm_signal, 1e7)
     assert start_time != False, f"Detecting Rising Edge Timed Out"
-    end_time = await detect_rising_edge(dut, 1e7)
+    end_time = await detect_rising_edge(pwm_signal, 1e7)
     assert end_time != False, f"Detecting Rising Edge Timed Out"
 
     period_time = end_time - start_time
@@ -249,19 +180,18 @@ async def test_pwm_duty(dut):
     cocotb.start_soon(clock.start())
     
     # Reset
-    sclk = 0; ncs = 1; bit = 0
-    dut.ui_in.value = ui_in_logicarray(ncs, bit, sclk)
+    dut.ui_in.value = 0 # ui_in[2:0] (SPI) is driven by tb_spi_master
     
     dut.rst_n.value = 0
     dut.ena.value = 1
-    await ClockCycles(dut.clk, 5)
+    await Timer(500, units="ns")
     dut.rst_n.value = 1
-    await ClockCycles(dut.clk, 5)
+    await Timer(500, units="ns")
 
     # Enable PWM output and PWM mode
     dut._log.info("Enabling PWM ouput and mode...")
-    await send_spi_transaction(dut, 1, 0x00, 0x01) # Write 1 to enable output
-    await send_spi_transaction(dut, 1, 0x02, 0x01) # Write 1 to enable PWM mode
+    await send_spi_transaction_int(dut, 1, 0x00, 0x01) # Write 1 to enable output
+    await send_spi_transaction_int(dut, 1, 0x02, 0x01) # Write 1 to enable PWM mode
 
     # Measure the time between two rising edges of the PWM signal 
     pwm_signal = dut.uo_out[0] # Change the index to whatever pin is enabled above
@@ -269,34 +199,29 @@ async def test_pwm_duty(dut):
     ###########################################################################################################################################
     # Test 0% duty cycle edge case
     dut._log.info("Testing 0% duty cycle...")
-    await send_spi_transaction(dut, 1, 0x04, 0x00) # Set 0% duty cycle
-    await ClockCycles(dut.clk, 1000)
+    await send_spi_transaction_int(dut, 1, 0x04, 0x00) # Set 0% duty cycle
+    await Timer(100, units="us")
     assert pwm_signal.value == 0, f"Expected duty cycle: 0%, Measured duty cycle: {pwm_signal.value}"
 
     ###########################################################################################################################################
     # Test 50% duty cycle
     dut._log.info("Testing 50% duty cycle...")
-    await send_spi_transaction(dut, 1, 0x04, 0x80)
+    await send_spi_transaction_int(dut, 1, 0x04, 0x80)
 
     # Give the design time to stabilize
-    await ClockCycles(dut.clk, 1000)
-
-    # Find period (Frequency already tested above so no need to do it here)
-    start_time = await detect_rising_edge(dut, 1e7)
-    assert start_time != False, f"Detecting Rising Edge Timed Out"
-    end_time = await detect_rising_edge(dut, 1e7)
-    assert end_time != False, f"Detecting Rising Edge Timed Out"
-
-    period_time = end_time - start_time
-
-    high_start_time = await detect_rising_edge(dut, 1e7)
-    assert high_start_time != False, f"Detecting Rising Edge Timed Out"
-    high_end_time = await detect_falling_edge(dut, 1e7)
-    assert high_end_time != False, f"Detecting Rising Edge Timed Out"
-
-    high_end_time = cocotb.utils.get_sim_time(units="ns")
-
-    high_time = high_end_time - high_start_time
+    await Timer(100, units="us")
+
+    # Measure rising, falling and next rising edge in one pass:
+    # high_time = t_fall - t_rise, period = t_rise2 - t_rise (Frequency already tested above)
+    rise_time = await detect_rising_edge(pwm_signal, 1e7)
+    assert rise_time != False, f"Detecting Rising Edge Timed Out"
+    fall_time = await detect_falling_edge(pwm_signal, 1e7)
+    assert fall_time != False, f"Detecting Falling Edge Timed Out"
+    next_rise_time = await detect_rising_edge(pwm_signal, 1e7)
+    assert next_rise_time != False, f"Detecting Rising Edge Timed Out"
+
+    high_time = fall_time - rise_time
+    period_time = next_rise_time - rise_time
     measured_duty_cycle = (high_time / period_time) * 100
 
     # Check if the PWM duty cycle for 50% is within ± 10% tolerance
@@ -308,8 +233,8 @@ async def test_pwm_duty(dut):
     ###########################################################################################################################################
     # Test 100% duty cycle edge case
     dut._log.info("Testing 100% duty cycle...")
-    await send_spi_transaction(dut, 1, 0x04, 0xFF) # Set 100% duty cycle
-    await ClockCycles(dut.clk, 1000)
+    await send_spi_transaction_int(dut, 1, 0x04, 0xFF) # Set 100% duty cycle
+    await Timer(100, units="us")
     assert pwm_signal.value == 1, f"Expected duty cycle: 100%, Measured duty cycle: {pwm_signal.value}"
 
     dut._log.info("PWM Duty Cycle test completed successfully")
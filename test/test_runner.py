@@ -0,0 +1,52 @@
+# SPDX-FileCopyrightText: © 2024 Tiny Tapeout
+# SPDX-License-Identifier: Apache-2.0
+
+# Runs each cocotb test in test.py in its own simulator process, so they can run in parallel:
+#   pytest -n 3 test_runner.py
+# Sources are taken from the Makefile. RTL only, use make GATES=yes for gate level simulation.
+# tb.vcd is only dumped with WAVES=1.
+
+import os
+import subprocess
+from pathlib import Path
+
+import pytest
+from cocotb.runner import get_runner
+
+TEST_DIR = Path(__file__).resolve().parent
+SRC_DIR = TEST_DIR.parent / "src"
+
+def makefile_verilog_sources(sim):
+    """Ask make for the expanded RTL VERILOG_SOURCES, so the runner builds exactly what make builds."""
+    result = subprocess.run(
+        ["make", "-s", f"SIM={sim}", "GATES=no", "print-VERILOG_SOURCES"],
+        cwd=TEST_DIR, env={**os.environ, "PWD": str(TEST_DIR)}, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"make print-VERILOG_SOURCES failed:\n{result.stderr}")
+    return result.stdout.split()
+
+@pytest.mark.parametrize("testcase", ["test_spi", "test_pwm_freq", "test_pwm_duty"])
+def test_project(testcase):
+    sim = os.getenv("SIM", "icarus")
+    runner = get_runner(sim)
+
+    # Each test builds and runs in its own directory so parallel runs don't share sim.vvp, tb.vcd or results.xml
+    build_dir = TEST_DIR / "sim_build" / "rtl" / testcase
+
+    runner.build(
+        verilog_sources=makefile_verilog_sources(sim),
+        includes=[SRC_DIR],
+        defines={} if os.getenv("WAVES") == "1" else {"NO_WAVES": 1},
+        hdl_toplevel="tb",
+        build_dir=build_dir,
+        always=True,
+        timescale=("1ns", "1ps"), # Same default as the Makefile flow for modules without `timescale
+    )
+    runner.test(
+        test_module="test",
+        hdl_toplevel="tb",
+        testcase=testcase,
+        build_dir=build_dir,
+        test_dir=build_dir,
+    )